@@ -1,26 +1,39 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, current_app, request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Callable, Dict
 from services.stock_data_scraper import StockDataScraper
 from services.stock_analyzer import StockAnalyzer
+from services.vol_nb import annualized_vol_matrix
+from services.yf_cache import get_yf_session
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
+import os
+import pickle
+import threading
+import time
+import orjson
 import yfinance as yf
+from cachetools import TTLCache
 
 # Configuração básica de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Os logs detalhados dos critérios (services.*) são DEBUG; em produção ficam em WARNING.
+# Use SERVICES_LOG_LEVEL=DEBUG para vê-los durante o desenvolvimento.
+logging.getLogger('services').setLevel(os.environ.get('SERVICES_LOG_LEVEL', 'WARNING'))
 
-app = Flask(__name__)
-scraper = StockDataScraper()
-analyzer = StockAnalyzer()
+bp = Blueprint('stocks', __name__)
 
-# Variável global para armazenar a volatilidade do mercado.
-# Idealmente, isto seria cacheado e atualizado periodicamente
-# para evitar recalcular em cada requisição.
-global_volatilidade_mercado = None
+# Cache dos resultados de /check_stock por ticker (um por aplicação, criado em create_app).
+# Guarda o dict já pronto para serialização (não o Response). TTLCache não é thread-safe, daí o lock.
+CHECK_STOCK_CACHE_TTL_SECONDS = 3600
 
-# Flag para garantir que a inicialização rode apenas uma vez
-setup_complete = False 
+# Cache em disco da volatilidade do benchmark. A volatilidade de 1 ano quase não muda
+# de um dia para o outro, então o resultado é reaproveitado entre reinícios por até 24h.
+BENCHMARK_CACHE_FILE = "benchmark_vol.pkl"
+BENCHMARK_TTL_SECONDS = 86400
 
 
 def calculate_market_volatility(tickers_to_benchmark: list):
@@ -31,17 +44,15 @@ def calculate_market_volatility(tickers_to_benchmark: list):
     logging.info("Calculando volatilidade de um conjunto de ações para benchmark...")
     
     # Adiciona o sufixo .SA para todos os tickers do benchmark
-    tickers_yf_format = [f"{t}{analyzer.B3_SUFFIX}" for t in tickers_to_benchmark]
+    tickers_yf_format = [f"{t}{StockAnalyzer.B3_SUFFIX}" for t in tickers_to_benchmark]
 
     end_date_vol = datetime.now()
     start_date_vol = end_date_vol - timedelta(days=365) # Último ano para volatilidade
-    
-    volatilidades_do_mercado = {}
 
     try:
         # Baixa dados de TODOS os tickers em UMA ÚNICA REQUISIÇÃO
         # Isso é muito mais eficiente do que um loop com download individual
-        data = yf.download(tickers_yf_format, start=start_date_vol, end=end_date_vol, progress=False)
+        data = yf.download(tickers_yf_format, start=start_date_vol, end=end_date_vol, progress=False, session=get_yf_session())
 
         if data.empty:
             logging.warning("    [Benchmark Volatilidade] Nenhum dado de benchmark baixado. Pode ser problema de conexão ou tickers inválidos.")
@@ -51,46 +62,119 @@ def calculate_market_volatility(tickers_to_benchmark: list):
         # 'data' terá múltiplos níveis de coluna se for mais de um ticker
         close_prices = data['Close']
 
-        for t in tickers_to_benchmark:
-            yf_ticker = f"{t}{analyzer.B3_SUFFIX}"
-            if yf_ticker in close_prices.columns:
-                # Retornos diários para este ticker específico
-                returns = close_prices[yf_ticker].pct_change().dropna()
-                if not returns.empty:
-                    volatilidad_anualizada = returns.std() * np.sqrt(252)
-                    volatilidades_do_mercado[t] = volatilidad_anualizada
-                else:
-                    logging.warning(f"    [Benchmark Volatilidade] Dados insuficientes ou sem variações para {t}.")
-            else:
-                logging.warning(f"    [Benchmark Volatilidade] Ticker {t} não encontrado nos dados baixados.")
+        colunas = [c for c in tickers_yf_format if c in close_prices.columns]
+        for c in tickers_yf_format:
+            if c not in colunas:
+                logging.warning(f"    [Benchmark Volatilidade] Ticker {c.replace(StockAnalyzer.B3_SUFFIX, '')} não encontrado nos dados baixados.")
+
+        # Volatilidade dos log-retornos diários de todos os tickers de uma vez (mesma métrica de
+        # verificar_menos_volatil), ignorando por coluna os dias sem cotação. Compilado com Numba.
+        arr = np.ascontiguousarray(close_prices[colunas].to_numpy(dtype=np.float64))
+        vols = annualized_vol_matrix(arr)
+        volatilidades_do_mercado = pd.Series(vols, index=[c.replace(StockAnalyzer.B3_SUFFIX, '') for c in colunas])
+
+        sem_dados = volatilidades_do_mercado.index[volatilidades_do_mercado.isna()]
+        for t in sem_dados:
+            logging.warning(f"    [Benchmark Volatilidade] Dados insuficientes ou sem variações para {t}.")
+        return volatilidades_do_mercado.dropna()
 
     except Exception as e:
         # Captura erros que podem ocorrer no download em bloco
         logging.error(f"    [Benchmark Volatilidade] Erro geral ao obter volatilidade para o benchmark: {e}")
 
-    return pd.Series(volatilidades_do_mercado)
+    return pd.Series(dtype=np.float64)
 
 
-# MODIFICAÇÃO AQUI: Usando @app.before_request com uma flag
-@app.before_request
-def setup_application():
+def calculate_market_volatility_cached(tickers_to_benchmark: list) -> pd.Series:
     """
-    Executa antes de cada requisição, mas o setup global só roda na primeira vez.
+    Versão com cache em disco de calculate_market_volatility.
+    Reutiliza o arquivo BENCHMARK_CACHE_FILE se ele tiver menos de BENCHMARK_TTL_SECONDS
+    e tiver sido gerado para a mesma lista de tickers; caso contrário, recalcula e regrava.
     """
-    global setup_complete
-    global global_volatilidade_mercado
+    tickers_key = sorted(tickers_to_benchmark)
 
-    if not setup_complete:
-        # Lista de tickers para calcular o benchmark de volatilidade.
-        # EXPANDA ESTA LISTA COM MUITAS AÇÕES DO IBOVESPA OU RELEVANTES.
-        tickers_para_benchmark = ["ITUB4", "BBDC4", "PETR4", "VALE3", "ABEV3", "WEGE3", "PRIO3", "MGLU3", "RENT3", "BPAC11"]
-        
-        global_volatilidade_mercado = calculate_market_volatility(tickers_para_benchmark)
-        logging.info("Setup inicial da aplicação concluído.")
-        setup_complete = True # Marca como completo para não rodar novamente
+    try:
+        if time.time() - os.path.getmtime(BENCHMARK_CACHE_FILE) < BENCHMARK_TTL_SECONDS:
+            with open(BENCHMARK_CACHE_FILE, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['tickers'] == tickers_key:
+                logging.info("Volatilidade do benchmark carregada do cache em disco.")
+                return cached['volatilidades']
+    except FileNotFoundError:
+        pass
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError) as e:
+        logging.warning(f"    [Benchmark Volatilidade] Cache em disco inválido, recalculando: {e}")
+
+    volatilidades = calculate_market_volatility(tickers_to_benchmark)
+
+    # Não grava benchmark vazio (falha de download) para não fixar o erro por 24h
+    if not volatilidades.empty:
+        try:
+            with open(BENCHMARK_CACHE_FILE, 'wb') as f:
+                pickle.dump({'tickers': tickers_key, 'volatilidades': volatilidades}, f)
+        except OSError as e:
+            logging.warning(f"    [Benchmark Volatilidade] Não foi possível gravar o cache em disco: {e}")
+
+    return volatilidades
+
+
+def _verificacoes_historico(analyzer: StockAnalyzer, vol_p90: float, ticker_upper: str,
+                            full_hist: pd.DataFrame, now: datetime) -> Dict[str, Callable[[], bool]]:
+    """
+    Monta as verificações que dependem do histórico de preços, da mais barata para a mais cara.
+    Todas usam o mesmo instante de referência (`now`), para que as janelas de datas fiquem alinhadas.
+    """
+    verificacoes = {
+        'liquidez_minima': partial(analyzer.verificar_liquidez_minima, ticker_upper, hist_data=full_hist, now=now),
+    }
+    # Passando a volatilidade de mercado pré-calculada
+    # Sem benchmark, o critério falha (o erro já foi registrado em check_stock)
+    if vol_p90 is not None:
+        verificacoes['menos_volatil'] = partial(
+            analyzer.verificar_menos_volatil, ticker_upper, vol_p90, hist_data=full_hist, now=now
+        )
+    else:
+        verificacoes['menos_volatil'] = lambda: False
+    verificacoes['altos_dividendos'] = partial(
+        analyzer.verificar_altos_dividendos_ponderados, ticker_upper, hist_data=full_hist, now=now
+    )
+    return verificacoes
+
+
+def _executar_verificacoes(verificacoes: Dict[str, Callable[[], bool]], resultados: dict, fast: bool) -> bool:
+    """
+    Executa as verificações e grava cada resultado em `resultados`.
+    
+    No modo rápido roda em série, na ordem do dict, e para no primeiro critério não atendido.
+    No modo exaustivo roda todas em paralelo.
+    
+    Returns:
+        bool: False se o modo rápido parou em um critério não atendido, True caso contrário.
+    """
+    if fast:
+        for criterio, verificacao in verificacoes.items():
+            resultados[criterio] = verificacao()
+            if not resultados[criterio]:
+                return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        futures = {executor.submit(verificacao): criterio for criterio, verificacao in verificacoes.items()}
+        for future in as_completed(futures):
+            resultados[futures[future]] = future.result()
+    return True
+
+
+def _json_response(payload: dict, status: int = 200):
+    """
+    Serializa a resposta com orjson, que trata escalares NumPy (ex: numpy.bool_) nativamente.
+    """
+    return current_app.response_class(
+        orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), status=status, mimetype='application/json'
+    )
 
 
-@app.route('/check_stock/<ticker>', methods=['GET'])
+@bp.route('/check_stock/<ticker>', methods=['GET'])
 def check_stock(ticker):
     """
     Endpoint para verificar se uma ação atende a todos os critérios.
@@ -98,29 +182,61 @@ def check_stock(ticker):
     Args:
         ticker (str): O código do ticker da ação a ser verificada.
         
+    Query params:
+        fast (opcional): Com fast=1, as verificações rodam da mais barata para a mais cara e param
+                         no primeiro critério não atendido; os critérios não avaliados vêm como null.
+        
     Returns:
         JSON: Um JSON contendo os resultados da verificação.
     """
     ticker_upper = ticker.upper()
+    fast = request.args.get('fast') == '1'
+    # Objetos compartilhados criados uma única vez em create_app (lidos aqui, na thread da requisição,
+    # pois as threads do ThreadPoolExecutor não têm o contexto da aplicação)
+    scraper = current_app.extensions['scraper']
+    analyzer = current_app.extensions['analyzer']
+    vol_p90 = current_app.config['VOL_BENCHMARK_P90']
+    check_stock_cache = current_app.extensions['check_stock_cache']
+    check_stock_cache_lock = current_app.extensions['check_stock_cache_lock']
     logging.info(f"Requisição para verificar ação: {ticker_upper}")
 
+    cache_key = (ticker_upper, fast)
+    with check_stock_cache_lock:
+        cached = check_stock_cache.get(cache_key)
+    if cached is not None:
+        logging.info(f"Resultado de {ticker_upper} servido do cache.")
+        return _json_response(cached)
+
+    # No modo rápido, critérios que não chegarem a ser avaliados ficam como None
+    valor_inicial = None if fast else False
     resultados = {
         'ticker': ticker_upper,
-        'liquidez_minima': False,
-        'lucro_positivo_ult_trimestre': False,
-        'lucros_crescentes_3_anos': False,
-        'limites_payout': False,
-        'menos_volatil': False,
-        'altos_dividendos': False,
+        'liquidez_minima': valor_inicial,
+        'lucro_positivo_ult_trimestre': valor_inicial,
+        'lucros_crescentes_3_anos': valor_inicial,
+        'limites_payout': valor_inicial,
+        'menos_volatil': valor_inicial,
+        'altos_dividendos': valor_inicial,
         'todos_criterios_atendidos': False,
         'erros': []
     }
 
     try:
-        # 1. Obter dados de scraping (Lucro e Payout)
+        # 1. Obter dados de scraping (Lucro e Payout) e o histórico de preços/dividendos dos últimos 3 anos.
+        # São requisições de rede independentes, então rodam em paralelo.
+        # No modo rápido o histórico só é baixado se os critérios baseados no scraping forem atendidos.
         logging.info(f"  Buscando dados de LPA/Payout e histórico financeiro para {ticker_upper} via scraping...")
-        lpa_payout_data = scraper.get_lpa_payout(ticker_upper)
-        financial_history_data = scraper.get_financial_history(ticker_upper)
+        # Um único instante de referência para toda a requisição
+        now = datetime.now()
+        full_hist = None
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            future_lpa_payout = executor.submit(scraper.get_lpa_payout, ticker_upper)
+            future_financial_history = executor.submit(scraper.get_financial_history, ticker_upper)
+            future_full_hist = None if fast else executor.submit(analyzer.obter_historico_completo, ticker_upper, now)
+            lpa_payout_data = future_lpa_payout.result()
+            financial_history_data = future_financial_history.result()
+            if future_full_hist is not None:
+                full_hist = future_full_hist.result()
 
         if not lpa_payout_data['lpa'] is None and not lpa_payout_data['payout'] is None:
             logging.info(f"  Dados de scraping obtidos: LPA={lpa_payout_data['lpa']}, Payout={lpa_payout_data['payout']}")
@@ -134,32 +250,38 @@ def check_stock(ticker):
             logging.warning(f"  Não foi possível obter histórico financeiro completo via scraping para {ticker_upper}.")
             resultados['erros'].append("Não foi possível obter histórico de lucros via scraping. Verifique a estrutura do site.")
 
-        # 2. Executar as verificações dos critérios
-        resultados['liquidez_minima'] = analyzer.verificar_liquidez_minima(ticker_upper)
-        
-        # Passando os dados extraídos pelo scraper
-        resultados['lucro_positivo_ult_trimestre'] = analyzer.verificar_lucro_positivo_ultimo_trimestre(
-            ticker_upper, financial_history_data.get('lucro_ultimo_trimestre')
-        )
-        resultados['lucros_crescentes_3_anos'] = analyzer.verificar_lucros_crescentes_3_anos(
-            ticker_upper, financial_history_data.get('lucros_anuais', [])
-        )
-        resultados['limites_payout'] = analyzer.verificar_limites_payout(
-            ticker_upper, lpa_payout_data.get('payout')
-        )
-        
-        # Passando a volatilidade de mercado pré-calculada
-        # Garante que global_volatilidade_mercado não é None
-        if global_volatilidade_mercado is not None:
-            resultados['menos_volatil'] = analyzer.verificar_menos_volatil(
-                ticker_upper, global_volatilidade_mercado
-            )
-        else:
+        if vol_p90 is None:
             logging.error("  Global volatility market data not available.")
             resultados['erros'].append("Dados de volatilidade do mercado não disponíveis para comparação.")
-            resultados['menos_volatil'] = False # Falha o critério se não há benchmark
-            
-        resultados['altos_dividendos'] = analyzer.verificar_altos_dividendos_ponderados(ticker_upper)
+
+        # 2. Executar as verificações dos critérios, da mais barata para a mais cara.
+        # Primeiro as que usam apenas os dados já obtidos pelo scraper.
+        verificacoes_scraping: Dict[str, Callable[[], bool]] = {
+            'limites_payout': partial(analyzer.verificar_limites_payout, ticker_upper, lpa_payout_data.get('payout')),
+            'lucro_positivo_ult_trimestre': partial(
+                analyzer.verificar_lucro_positivo_ultimo_trimestre,
+                ticker_upper, financial_history_data.get('lucro_ultimo_trimestre')
+            ),
+            'lucros_crescentes_3_anos': partial(
+                analyzer.verificar_lucros_crescentes_3_anos,
+                ticker_upper, financial_history_data.get('lucros_anuais', [])
+            ),
+        }
+
+        if fast:
+            if _executar_verificacoes(verificacoes_scraping, resultados, fast=True):
+                full_hist = analyzer.obter_historico_completo(ticker_upper, now)
+                _executar_verificacoes(_verificacoes_historico(analyzer, vol_p90, ticker_upper, full_hist, now), resultados, fast=True)
+        else:
+            _executar_verificacoes(
+                {**verificacoes_scraping, **_verificacoes_historico(analyzer, vol_p90, ticker_upper, full_hist, now)}, resultados, fast=False
+            )
+
+        # Histórico vazio (falha no download do Yahoo): os critérios baseados nele saem False,
+        # mas é uma falha de dados, não um veredito
+        if full_hist is not None and full_hist.empty:
+            logging.warning(f"  Histórico de preços/dividendos não disponível para {ticker_upper}.")
+            resultados['erros'].append("Não foi possível obter o histórico de preços/dividendos.")
         
         resultados['todos_criterios_atendidos'] = all([
             resultados['liquidez_minima'],
@@ -171,19 +293,55 @@ def check_stock(ticker):
         ])
         
         logging.info(f"Verificação completa para {ticker_upper}. Todos os critérios atendidos: {resultados['todos_criterios_atendidos']}")
-        # Convertendo todos os valores numpy.bool_ para bool
-        resultados = {k: bool(v) if isinstance(v, np.bool_) else v for k, v in resultados.items()}
-        return jsonify(resultados)
+        # Só guarda respostas completas: uma falha transitória (scraping, benchmark) não pode
+        # fixar um veredito negativo durante todo o TTL
+        if not resultados['erros']:
+            with check_stock_cache_lock:
+                check_stock_cache[cache_key] = resultados
+        return _json_response(resultados)
 
     except Exception as e:
         logging.exception(f"Erro inesperado ao processar {ticker_upper}: {e}")
         resultados['erros'].append(f"Erro inesperado no servidor: {str(e)}")
-        return jsonify(resultados), 500 # Retorna 500 em caso de erro interno do servidor
+        return _json_response(resultados, 500) # Retorna 500 em caso de erro interno do servidor
 
-@app.route('/')
+@bp.route('/')
 def home():
     return "Bem-vindo à API de Análise de Ações! Use /check_stock/<ticker> para verificar uma ação."
 
+
+def create_app() -> Flask:
+    """
+    Cria e configura a aplicação.
+    
+    O scraper, o analisador e o benchmark de volatilidade são criados aqui uma única vez,
+    de forma síncrona. Com o preload_app do Gunicorn (ver gunicorn.conf.py), isso acontece
+    no processo master antes do fork, e os workers compartilham os dados somente leitura.
+    """
+    app = Flask(__name__)
+    app.extensions['scraper'] = StockDataScraper()
+    app.extensions['analyzer'] = StockAnalyzer()
+    app.extensions['check_stock_cache'] = TTLCache(maxsize=1024, ttl=CHECK_STOCK_CACHE_TTL_SECONDS)
+    app.extensions['check_stock_cache_lock'] = threading.Lock()
+
+    # Lista de tickers para calcular o benchmark de volatilidade.
+    # EXPANDA ESTA LISTA COM MUITAS AÇÕES DO IBOVESPA OU RELEVANTES.
+    tickers_para_benchmark = ["ITUB4", "BBDC4", "PETR4", "VALE3", "ABEV3", "WEGE3", "PRIO3", "MGLU3", "RENT3", "BPAC11"]
+
+    vol_benchmark = calculate_market_volatility_cached(tickers_para_benchmark)
+    # Limite do primeiro décil de maior volatilidade (percentil 90 do benchmark): o valor de
+    # volatilidade abaixo do qual estão os 90% menos voláteis.
+    app.config['VOL_BENCHMARK_P90'] = (
+        float(np.quantile(vol_benchmark.to_numpy(), 0.90)) if not vol_benchmark.empty else None
+    )
+
+    app.register_blueprint(bp)
+    logging.info("Setup inicial da aplicação concluído.")
+    return app
+
+
+app = create_app()
+
 if __name__ == '__main__':
     # Para rodar a aplicação em modo de desenvolvimento
     # Em produção, use um servidor WSGI como Gunicorn ou uWSGI
@@ -0,0 +1,9 @@
+# Configuração do Gunicorn: gunicorn -c gunicorn.conf.py
+wsgi_app = "app:app"
+bind = "0.0.0.0:5000"
+workers = 4
+threads = 4
+
+# Carrega a aplicação (create_app) no processo master antes do fork, para que o benchmark
+# de volatilidade seja calculado uma única vez e compartilhado pelos workers.
+preload_app = True
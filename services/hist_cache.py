@@ -0,0 +1,69 @@
+import glob
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from services.yf_cache import cached_download
+
+logger = logging.getLogger(__name__)
+
+# Cache em disco (parquet) do histórico diário de cada ticker e janela. As barras diárias só
+# mudam uma vez por pregão, então um histórico com menos de 4h é reaproveitado sem ir ao Yahoo.
+# O memo em memória do yf_cache usa o mesmo prazo: passadas as 4h, o download é refeito de fato.
+CACHE_DIR = "cache"
+HIST_CACHE_TTL_SECONDS = 4 * 3600
+
+
+def get_history(ticker: str, days: int = 1100, end_date: datetime = None) -> pd.DataFrame:
+    """
+    Retorna o histórico de preços e dividendos de um ticker, usando
+    cache/<ticker>_<days>d_<data final>.parquet (um arquivo por janela).
+
+    Args:
+        ticker (str): O ticker no formato do yfinance (ex: 'PETR4.SA').
+        days (int): Tamanho da janela do histórico, em dias.
+        end_date (datetime, opcional): Data final do histórico. Padrão: agora.
+
+    Returns:
+        pd.DataFrame: O histórico (vazio se o download falhar).
+    """
+    if end_date is None:
+        end_date = datetime.now()
+    path = os.path.join(CACHE_DIR, f"{ticker}_{days}d_{end_date.date().isoformat()}.parquet")
+
+    try:
+        if time.time() - os.path.getmtime(path) < HIST_CACHE_TTL_SECONDS:
+            return pd.read_parquet(path)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning("    [Histórico] Cache em disco inválido para %s, baixando novamente: %s", ticker, e)
+
+    start_date = end_date - timedelta(days=days)
+    hist_data = cached_download(ticker, start_date.date().isoformat(), end_date.date().isoformat(), actions=True)
+
+    if not hist_data.empty:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # Grava em arquivo temporário e renomeia: outro worker nunca lê um parquet pela metade
+            fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".parquet.tmp")
+            os.close(fd)
+            try:
+                hist_data.to_parquet(tmp_path, engine="pyarrow")
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            # Arquivos da mesma janela com data final anterior não serão mais lidos
+            for antigo in glob.glob(os.path.join(CACHE_DIR, f"{glob.escape(ticker)}_{days}d_*.parquet")):
+                if antigo != path:
+                    try:
+                        os.remove(antigo)
+                    except FileNotFoundError:
+                        pass  # Outro worker já removeu
+        except (OSError, ValueError) as e:
+            logger.warning("    [Histórico] Não foi possível gravar o cache em disco para %s: %s", ticker, e)
+
+    return hist_data
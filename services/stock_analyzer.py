@@ -1,7 +1,10 @@
-import yfinance as yf
+import logging
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from services.hist_cache import get_history
+
+logger = logging.getLogger(__name__)
 
 class StockAnalyzer:
     """
@@ -9,41 +12,78 @@ class StockAnalyzer:
     """
     
     B3_SUFFIX = ".SA" # Sufixo para ações da B3 (bolsa brasileira)
+    HISTORICO_DIAS = 3 * 365 + 30 # Janela do histórico completo: 36 meses + margem
 
     def __init__(self):
         pass # Nenhuma inicialização específica necessária por enquanto
 
-    def verificar_liquidez_minima(self, ticker: str, volume_minimo_diario_brl: float = 3_000_000) -> bool:
+    def obter_historico_completo(self, ticker: str, end_date: datetime = None) -> pd.DataFrame:
+        """
+        Obtém o histórico de preços e dividendos dos últimos 3 anos (com margem) em uma única requisição.
+        Usa o cache em disco de services.hist_cache (e, abaixo dele, o cache em memória de
+        services.yf_cache), então chamadas repetidas não vão ao Yahoo.
+        
+        Args:
+            ticker (str): O código do ticker da ação (sem o sufixo .SA).
+            end_date (datetime, opcional): Data final do histórico. Padrão: agora.
+            
+        Returns:
+            pd.DataFrame: O histórico (vazio se o download falhar). Não deve ser modificado.
+        """
+        return get_history(f"{ticker}{self.B3_SUFFIX}", days=self.HISTORICO_DIAS, end_date=end_date)
+
+    def _obter_historico(self, ticker: str, start_date: datetime, end_date: datetime,
+                         hist_data: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Retorna o histórico da ação no intervalo pedido.
+        
+        Se um histórico já baixado for fornecido (ex: o histórico de 3 anos obtido uma única vez
+        pelo endpoint), apenas recorta o intervalo pelo índice, evitando uma nova requisição ao Yahoo.
+        Caso contrário, obtém o histórico completo (com cache) e recorta da mesma forma.
+        """
+        if hist_data is None:
+            hist_data = self.obter_historico_completo(ticker, end_date)
+        if hist_data.empty:
+            return hist_data
+        return hist_data.loc[start_date:end_date]
+
+    def verificar_liquidez_minima(self, ticker: str, volume_minimo_diario_brl: float = 3_000_000,
+                                  hist_data: pd.DataFrame = None, now: datetime = None) -> bool:
         """
         Verifica se a ação possui uma liquidez mínima diária (volume financeiro) nos últimos 3 meses.
         
         Args:
             ticker (str): O código do ticker da ação (ex: 'ITUB4').
             volume_minimo_diario_brl (float): O volume financeiro mínimo diário em BRL.
+            hist_data (pd.DataFrame, opcional): Histórico já baixado da ação. Se fornecido,
+                                                é recortado em vez de fazer um novo download.
+            now (datetime, opcional): Instante de referência das janelas de datas. O endpoint passa um único
+                                      valor para todas as verificações; se omitido, usa datetime.now().
             
         Returns:
             bool: True se a liquidez for atendida, False caso contrário.
         """
         try:
-            end_date = datetime.now()
+            end_date = now or datetime.now()
             start_date = end_date - timedelta(days=90) # Aproximadamente 3 meses
             
-            hist_data = yf.download(f"{ticker}{self.B3_SUFFIX}", start=start_date, end=end_date, progress=False)
+            hist_data = self._obter_historico(ticker, start_date, end_date, hist_data)
             
             if hist_data.empty:
-                print(f"    [Liquidez] Dados históricos não encontrados para {ticker}.")
+                logger.debug("    [Liquidez] Dados históricos não encontrados para %s.", ticker)
                 return False
             
-            hist_data['Volume_Financeiro'] = hist_data['Close'] * hist_data['Volume']
-            media_volume_financeiro = hist_data['Volume_Financeiro'].mean()
+            # Não cria coluna nova: hist_data pode ser um recorte do histórico compartilhado
+            volume_financeiro = hist_data['Close'] * hist_data['Volume']
+            media_volume_financeiro = volume_financeiro.mean()
             
-            liquidez_atendida = media_volume_financeiro >= volume_minimo_diario_brl
+            liquidez_atendida = bool(media_volume_financeiro >= volume_minimo_diario_brl)
             
-            print(f"    [Liquidez] Média Volume Financeiro (3m): R$ {media_volume_financeiro:,.2f}. Atende: {liquidez_atendida}")
+            logger.debug("    [Liquidez] Média Volume Financeiro (3m): R$ %.2f. Atende: %s", media_volume_financeiro, liquidez_atendida)
             return liquidez_atendida
             
         except Exception as e:
-            print(f"    [Liquidez] Erro ao verificar liquidez para {ticker}: {e}")
+            logger.warning("    [Liquidez] Erro ao verificar liquidez para %s: %s", ticker, e)
             return False
 
     def verificar_lucro_positivo_ultimo_trimestre(self, ticker: str, lucro_ultimo_trimestre: float) -> bool:
@@ -60,15 +100,15 @@ class StockAnalyzer:
         """
         try:
             if lucro_ultimo_trimestre is None:
-                print(f"    [Lucro Trimestral] Dados de lucro do último trimestre não disponíveis para {ticker}.")
+                logger.debug("    [Lucro Trimestral] Dados de lucro do último trimestre não disponíveis para %s.", ticker)
                 return False
                 
-            lucro_positivo = lucro_ultimo_trimestre > 0
-            print(f"    [Lucro Trimestral] Lucro Último Trimestre: R$ {lucro_ultimo_trimestre:,.2f}. Positivo: {lucro_positivo}")
+            lucro_positivo = bool(lucro_ultimo_trimestre > 0)
+            logger.debug("    [Lucro Trimestral] Lucro Último Trimestre: R$ %.2f. Positivo: %s", lucro_ultimo_trimestre, lucro_positivo)
             return lucro_positivo
             
         except Exception as e:
-            print(f"    [Lucro Trimestral] Erro ao verificar lucro do último trimestre para {ticker}: {e}")
+            logger.warning("    [Lucro Trimestral] Erro ao verificar lucro do último trimestre para %s: %s", ticker, e)
             return False
 
     def verificar_lucros_crescentes_3_anos(self, ticker: str, lucros_anuais: list) -> bool:
@@ -84,20 +124,17 @@ class StockAnalyzer:
         """
         try:
             if not isinstance(lucros_anuais, list) or len(lucros_anuais) < 3:
-                print(f"    [Lucros Crescentes] Dados de lucro anual insuficientes para os últimos 3 anos para {ticker}.")
+                logger.debug("    [Lucros Crescentes] Dados de lucro anual insuficientes para os últimos 3 anos para %s.", ticker)
                 return False
             
-            crescente = True
-            for i in range(len(lucros_anuais) - 1):
-                if lucros_anuais[i+1] <= lucros_anuais[i]:
-                    crescente = False
-                    break
+            lucros = np.asarray(lucros_anuais, dtype=np.float64)
+            crescente = bool(np.all(np.diff(lucros) > 0))
             
-            print(f"    [Lucros Crescentes] Lucros Anuais (3 anos): {lucros_anuais}. Crescentes: {crescente}")
+            logger.debug("    [Lucros Crescentes] Lucros Anuais (3 anos): %s. Crescentes: %s", lucros_anuais, crescente)
             return crescente
             
         except Exception as e:
-            print(f"    [Lucros Crescentes] Erro ao verificar lucros crescentes para {ticker}: {e}")
+            logger.warning("    [Lucros Crescentes] Erro ao verificar lucros crescentes para %s: %s", ticker, e)
             return False
 
     def verificar_limites_payout(self, ticker: str, payout_valor: float) -> bool:
@@ -113,64 +150,72 @@ class StockAnalyzer:
         """
         try:
             if payout_valor is None:
-                print(f"    [Payout] Dados de payout dos últimos 12 meses não disponíveis para {ticker}.")
+                logger.debug("    [Payout] Dados de payout dos últimos 12 meses não disponíveis para %s.", ticker)
                 return False
             
-            payout_valido = (payout_valor >= 0.30) and (payout_valor <= 5.00)
+            payout_valido = bool((payout_valor >= 0.30) and (payout_valor <= 5.00))
             
-            print(f"    [Payout] Payout (12 meses): {payout_valor*100:.2f}%. Dentro dos limites (30%-500%): {payout_valido}")
+            logger.debug("    [Payout] Payout (12 meses): %.2f%%. Dentro dos limites (30%%-500%%): %s", payout_valor * 100, payout_valido)
             return payout_valido
             
         except Exception as e:
-            print(f"    [Payout] Erro ao verificar limites de payout para {ticker}: {e}")
+            logger.warning("    [Payout] Erro ao verificar limites de payout para %s: %s", ticker, e)
             return False
 
-    def verificar_menos_volatil(self, ticker: str, volatilidade_outras_acoes: pd.Series = None) -> bool:
+    def verificar_menos_volatil(self, ticker: str, limite_primeiro_decil: float = None,
+                                hist_data: pd.DataFrame = None, now: datetime = None) -> bool:
         """
         Verifica se a ação é menos volátil, excluindo o primeiro décil de maior volatilidade.
         
         Args:
             ticker (str): O código do ticker da ação.
-            volatilidade_outras_acoes (pd.Series, opcional): Uma série Pandas contendo a volatilidade
-                                                             anualizada de várias outras ações (índice da volatilidade).
-                                                             Se não fornecido, a função não pode determinar o décil
-                                                             e falha o critério.
+            limite_primeiro_decil (float, opcional): O percentil 90 da volatilidade anualizada de várias
+                                                     outras ações (benchmark), calculado uma única vez no setup.
+                                                     Se não fornecido, a função não pode determinar o décil
+                                                     e falha o critério.
+            hist_data (pd.DataFrame, opcional): Histórico já baixado da ação. Se fornecido,
+                                                é recortado em vez de fazer um novo download.
+            now (datetime, opcional): Instante de referência das janelas de datas. O endpoint passa um único
+                                      valor para todas as verificações; se omitido, usa datetime.now().
         Returns:
             bool: True se a ação for considerada menos volátil, False caso contrário.
         """
         try:
-            end_date = datetime.now()
+            end_date = now or datetime.now()
             start_date = end_date - timedelta(days=365) # Último ano para volatilidade
             
-            hist_data = yf.download(f"{ticker}{self.B3_SUFFIX}", start=start_date, end=end_date, progress=False)
+            hist_data = self._obter_historico(ticker, start_date, end_date, hist_data)
             
-            if hist_data.empty or len(hist_data) < 2:
-                print(f"    [Volatilidade] Dados históricos insuficientes para calcular volatilidade de {ticker}.")
+            if hist_data.empty:
+                logger.debug("    [Volatilidade] Dados históricos insuficientes para calcular volatilidade de %s.", ticker)
+                return False
+
+            close = hist_data['Close'].dropna().to_numpy(dtype=np.float64)
+            if len(close) < 3:
+                logger.debug("    [Volatilidade] Dados históricos insuficientes para calcular volatilidade de %s.", ticker)
                 return False
                 
-            retornos_diarios = hist_data['Close'].pct_change().dropna()
-            volatilidade_anualizada = retornos_diarios.std() * np.sqrt(252)
+            # Log-retornos diários direto no array NumPy, sem Series intermediárias
+            retornos_diarios = np.diff(np.log(close))
+            volatilidade_anualizada = retornos_diarios.std(ddof=1) * np.sqrt(252)
             
-            print(f"    [Volatilidade] Volatilidade Anualizada: {volatilidade_anualizada*100:.2f}%")
+            logger.debug("    [Volatilidade] Volatilidade Anualizada: %.2f%%", volatilidade_anualizada * 100)
 
-            if volatilidade_outras_acoes is None or volatilidade_outras_acoes.empty:
-                print(f"    [Volatilidade] Não foi fornecido um benchmark de volatilidade (outras ações) para determinar o décil. Critério não atendido por falta de dados comparativos.")
+            if limite_primeiro_decil is None:
+                logger.debug("    [Volatilidade] Não foi fornecido um benchmark de volatilidade (outras ações) para determinar o décil. Critério não atendido por falta de dados comparativos.")
                 return False
             
-            # Calcula o limite do primeiro décil de maior volatilidade
-            # Este é o valor de volatilidade abaixo do qual estão os 90% menos voláteis.
-            limite_primeiro_decil = volatilidade_outras_acoes.quantile(0.90)
-            
-            criterio_volatil = volatilidade_anualizada < limite_primeiro_decil
+            criterio_volatil = bool(volatilidade_anualizada < limite_primeiro_decil)
             
-            print(f"    [Volatilidade] Limite do 1º Décil (mais voláteis): {limite_primeiro_decil*100:.2f}%. Menos volátil que o 1º décil: {criterio_volatil}")
+            logger.debug("    [Volatilidade] Limite do 1º Décil (mais voláteis): %.2f%%. Menos volátil que o 1º décil: %s", limite_primeiro_decil * 100, criterio_volatil)
             return criterio_volatil
             
         except Exception as e:
-            print(f"    [Volatilidade] Erro ao verificar volatilidade para {ticker}: {e}")
+            logger.warning("    [Volatilidade] Erro ao verificar volatilidade para %s: %s", ticker, e)
             return False
 
-    def verificar_altos_dividendos_ponderados(self, ticker: str, pesos: dict = None, dy_minimo_ponderado: float = 0.04) -> bool:
+    def verificar_altos_dividendos_ponderados(self, ticker: str, pesos: dict = None, dy_minimo_ponderado: float = 0.04,
+                                              hist_data: pd.DataFrame = None, now: datetime = None) -> bool:
         """
         Verifica se a empresa pagou altos dividendos nos últimos 36 meses,
         usando um modelo ponderado. O critério "altos" é definido por um DY médio ponderado.
@@ -181,6 +226,10 @@ class StockAnalyzer:
                           A soma dos pesos deve ser 1.0. Ex: {'12m': 0.5, '24m': 0.3, '36m': 0.2}.
                           Se não especificado, usa pesos padrão.
             dy_minimo_ponderado (float): O Dividend Yield ponderado mínimo para ser considerado "alto".
+            hist_data (pd.DataFrame, opcional): Histórico já baixado da ação (com a coluna 'Dividends').
+                                                Se fornecido, é recortado em vez de fazer um novo download.
+            now (datetime, opcional): Instante de referência das janelas de datas. O endpoint passa um único
+                                      valor para todas as verificações; se omitido, usa datetime.now().
                       
         Returns:
             bool: True se o Dividend Yield ponderado atender ao critério de "alto", False caso contrário.
@@ -188,29 +237,33 @@ class StockAnalyzer:
         if pesos is None:
             pesos = {'12m': 0.5, '24m': 0.3, '36m': 0.2} # Pesos padrão
         
-        end_date = datetime.now()
+        end_date = now or datetime.now()
         start_date_36m = end_date - timedelta(days=36 * 30 + 15) # 36 meses + uma margem para garantir dados
 
         try:
-            hist_data = yf.download(f"{ticker}{self.B3_SUFFIX}", start=start_date_36m, end=end_date, progress=False)
+            hist_data = self._obter_historico(ticker, start_date_36m, end_date, hist_data)
             
             if hist_data.empty:
-                print(f"    [Dividendos] Dados históricos não encontrados para {ticker}.")
+                logger.debug("    [Dividendos] Dados históricos não encontrados para %s.", ticker)
                 return False
 
             dividends = hist_data['Dividends'].fillna(0)
             
             current_price = hist_data['Close'].iloc[-1] if not hist_data['Close'].empty else 1.0
             if current_price == 0:
-                print(f"    [Dividendos] Preço atual da ação é zero. Não é possível calcular DY.")
+                logger.debug("    [Dividendos] Preço atual da ação é zero. Não é possível calcular DY.")
                 return False
 
-            # Calcular dividendos para cada período
-            dividends_last_12m = dividends[dividends.index >= (end_date - timedelta(days=365))].sum()
-            dividends_last_24m = dividends[(dividends.index >= (end_date - timedelta(days=2 * 365))) & 
-                                            (dividends.index < (end_date - timedelta(days=365)))].sum()
-            dividends_last_36m_rest = dividends[(dividends.index >= (end_date - timedelta(days=3 * 365))) & 
-                                                (dividends.index < (end_date - timedelta(days=2 * 365)))].sum()
+            # Calcular dividendos para cada período.
+            # O índice do yfinance vem ordenado, então os limites de 12/24/36 meses são achados por
+            # busca binária e cada período é a soma de uma fatia contígua, sem máscaras booleanas.
+            idx = dividends.index.to_numpy()
+            values = dividends.to_numpy(dtype=np.float64)
+            limites = np.array([end_date - timedelta(days=anos * 365) for anos in (1, 2, 3)], dtype='datetime64[ns]')
+            i12, i24, i36 = np.searchsorted(idx, limites)
+            dividends_last_12m = values[i12:].sum()
+            dividends_last_24m = values[i24:i12].sum()
+            dividends_last_36m_rest = values[i36:i24].sum()
             
             # Calcular DY para cada período usando o preço atual (simplificação)
             dy_12m = (dividends_last_12m / current_price) if current_price > 0 else 0
@@ -221,11 +274,12 @@ class StockAnalyzer:
                            (dy_24m * pesos.get('24m', 0)) + \
                            (dy_36m * pesos.get('36m', 0))
             
-            criterio_altos_dividendos = dy_ponderado >= dy_minimo_ponderado 
+            criterio_altos_dividendos = bool(dy_ponderado >= dy_minimo_ponderado) 
             
-            print(f"    [Dividendos] DY Ponderado (12m: {dy_12m*100:.2f}%, 24m: {dy_24m*100:.2f}%, 36m: {dy_36m*100:.2f}%): {dy_ponderado*100:.2f}%. Alto: {criterio_altos_dividendos}")
+            logger.debug("    [Dividendos] DY Ponderado (12m: %.2f%%, 24m: %.2f%%, 36m: %.2f%%): %.2f%%. Alto: %s",
+                         dy_12m * 100, dy_24m * 100, dy_36m * 100, dy_ponderado * 100, criterio_altos_dividendos)
             return criterio_altos_dividendos
             
         except Exception as e:
-            print(f"    [Dividendos] Erro ao verificar altos dividendos para {ticker}: {e}")
+            logger.warning("    [Dividendos] Erro ao verificar altos dividendos para %s: %s", ticker, e)
             return False
\ No newline at end of file
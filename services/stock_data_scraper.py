@@ -1,133 +1,506 @@
+import asyncio
+import codecs
+import copy
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
 import requests
 from bs4 import BeautifulSoup
-import re
+from bs4.dammit import EncodingDetector
+from cachetools import TTLCache
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from datetime import timedelta
+from lxml import etree, html
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["StockDataScraper"]
+
+_URL_INVESTIDOR10 = "https://investidor10.com.br/acoes/{ticker}/"
+_URL_STATUSINVEST = "https://statusinvest.com.br/acoes/{ticker}"
+_URL_FUNDAMENTUS = "https://www.fundamentus.com.br/detalhes.php?papel={ticker}"
+
+# Um 404 na fonte principal significa que o ticker não existe: as demais fontes não são consultadas
+_FONTE_PRINCIPAL = "Investidor10"
+
+# XPath compiladas uma única vez: cada consulta roda inteira no lxml (C) e devolve só os nós
+# necessários, em vez de navegar a árvore em Python com find/find_next.
+# O XPath 1.0 não tem lower-case(): o translate() faz a comparação sem diferenciar maiúsculas.
+_TEXTO_MINUSCULO = (
+    "translate(normalize-space(.), 'ABCDEFGHIJKLMNOPQRSTUVWXYZÁÉÍÓÚÂÊÔÃÕÇ', "
+    "'abcdefghijklmnopqrstuvwxyzáéíóúâêôãõç')"
+)
+_TH_LUCRO = f"th[contains({_TEXTO_MINUSCULO}, 'lucro líquido') or contains({_TEXTO_MINUSCULO}, 'resultado líquido')]"
+_XP_SI_LPA = etree.XPath(f"(//h3[contains({_TEXTO_MINUSCULO}, 'lpa')])[1]/following::strong[1]")
+_XP_SI_PAYOUT = etree.XPath(f"(//h3[contains({_TEXTO_MINUSCULO}, 'payout')])[1]/following::strong[1]")
+# Dos lucros anuais só interessam os 3 anos mais recentes (as últimas colunas): a consulta já
+# devolve apenas as últimas células da linha, com folga para anos sem valor ("-")
+_LUCROS_ANUAIS_MAX_CELULAS = 10
+_XP_SI_LUCROS_ANUAIS = etree.XPath(
+    f"(//h2[contains({_TEXTO_MINUSCULO}, 'resultados históricos')])[1]/following::table[1]//tr[{_TH_LUCRO}][1]"
+    f"/td[position() > last() - {_LUCROS_ANUAIS_MAX_CELULAS}]"
+)
+_XP_SI_LUCRO_TRIMESTRE = etree.XPath(
+    f"(//h3[contains({_TEXTO_MINUSCULO}, 'resultados trimestrais')])[1]/following::table[1]//tr[{_TH_LUCRO}][1]/td[1]"
+)
+
+# Rótulos da página de detalhes do Fundamentus -> campo do resultado
+_FUNDAMENTUS_CAMPOS = {
+    "lpa": "lpa",
+    "div. líquida / patrimonio": "payout",
+}
+
+# Números no formato brasileiro ("1.234,56%" -> "1234.56") normalizados em uma única passada
+_NUM_TRANS = str.maketrans({".": None, "%": None, " ": None, ",": "."})
+
+# Páginas já parseadas ficam em memória por pouco tempo: a mesma página do Status Invest é usada
+# por get_lpa_payout e por get_financial_history. Poucas entradas, pois cada árvore é grande.
+_TREE_CACHE_TTL_SECONDS = 300
+_TREE_CACHE_MAXSIZE = 16
+
+# Limite de bytes lidos de cada página
+_MAX_BYTES = 2_000_000
+_CHUNK_BYTES = 64 * 1024
+
+# Quanto tempo get_lpa_payout espera pela fonte principal (Investidor10) antes de disparar as demais
+_FALLBACK_DELAY_SECONDS = 1.0
+
+# Cache em disco das páginas (cache/paginas/), já truncadas em _MAX_BYTES. LPA, payout e lucros
+# mudam no máximo a cada trimestre, então as páginas são reaproveitadas entre execuções e workers.
+# A página do Status Invest traz tanto LPA/payout quanto o histórico de lucros, por isso fica com
+# o prazo mais curto. Não usa o requests_cache: ele lê e grava o corpo inteiro antes do streaming.
+_PAGE_CACHE_DIR = os.path.join("cache", "paginas")
+_PAGE_CACHE_EXPIRE = timedelta(hours=12)
+_PAGE_CACHE_EXPIRE_POR_SITE = {
+    "investidor10.com.br": timedelta(hours=24),
+    "statusinvest.com.br": timedelta(hours=12),
+    "www.fundamentus.com.br": timedelta(hours=24),
+}
+
+
+class _TickerNaoEncontrado(Exception):
+    def __init__(self, fonte: str):
+        super().__init__(fonte)
+        self.fonte = fonte
+
+
+def _to_float(text: str):
+    try:
+        return float(text.translate(_NUM_TRANS))
+    except ValueError:
+        return None
+
+
+def _build_tree(body: bytes, encoding: str = None):
+    # O charset do Content-Type tem precedência; sem ele, vale o <meta charset> da página, que o
+    # próprio lxml encontra. Sem nenhum dos dois o lxml assumiria latin-1: usa UTF-8 se o corpo
+    # for UTF-8 válido (o decoder incremental tolera um caractere cortado pelo _MAX_BYTES).
+    if not encoding and EncodingDetector.find_declared_encoding(body, is_html=True) is None:
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(body)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            pass
+    if encoding:
+        try:
+            return html.fromstring(body, parser=html.HTMLParser(encoding=encoding))
+        except LookupError:
+            pass
+    return html.fromstring(body)
+
+
+def _build_soup(body: bytes, encoding: str = None):
+    return BeautifulSoup(body, "lxml", from_encoding=encoding)
+
+
+def _ttl_cache(seconds: int, maxsize: int = 256):
+    # Memoriza em memória o resultado de um método por ticker durante `seconds`: pedidos repetidos
+    # do mesmo ticker (ex: check_stock com e sem ?fast=1) não voltam aos sites. O cache é de cada
+    # instância do scraper. Só resultados completos ficam em cache: se alguma fonte falhou e faltou
+    # um campo, a próxima chamada tenta de novo.
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, ticker: str) -> dict:
+            key = ticker.upper()
+            with self._result_cache_lock:
+                cache = self._result_caches.get(method.__name__)
+                if cache is None:
+                    cache = self._result_caches[method.__name__] = TTLCache(maxsize=maxsize, ttl=seconds)
+                value = cache.get(key)
+            if value is None:
+                value = method(self, ticker)
+                if all(v is not None and v != [] for v in value.values()):
+                    with self._result_cache_lock:
+                        cache[key] = value
+            # Cópia: quem chama pode alterar o dict/lista sem afetar o cache
+            return copy.deepcopy(value)
+        return wrapper
+    return decorator
+
 
 class StockDataScraper:
     def __init__(self):
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         }
+        # Sessão persistente: reaproveita conexões (keep-alive) com os sites entre os scrapes.
+        # O caminho síncrono fica no requests (e não no httpx em HTTP/2 do caminho assíncrono) por
+        # causa do Retry do HTTPAdapter abaixo, que o httpx não oferece para códigos de status.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # O Retry-After de um 429/503 é ignorado: o sleep dele não é coberto pelo timeout=10 e um
+        # "Retry-After: 300" travaria o check_stock por minutos. Vale só o backoff curto.
+        retry = Retry(
+            total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False, respect_retry_after_header=False,
+        )
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._tree_cache = TTLCache(maxsize=_TREE_CACHE_MAXSIZE, ttl=_TREE_CACHE_TTL_SECONDS)
+        self._tree_cache_lock = threading.Lock()
+        # Resultados de get_lpa_payout / get_financial_history por ticker (ver _ttl_cache)
+        self._result_caches = {}
+        self._result_cache_lock = threading.Lock()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_body(self, url: str):
+        # Retorna (corpo, charset do Content-Type ou None). O arquivo em cache guarda o charset
+        # na primeira linha, seguido do corpo: sem ele, páginas sem <meta charset> seriam lidas
+        # como latin-1 e as buscas por texto acentuado falhariam em silêncio.
+        path = os.path.join(_PAGE_CACHE_DIR, hashlib.sha1(url.encode()).hexdigest() + ".pagina")
+        expire = _PAGE_CACHE_EXPIRE_POR_SITE.get(urlsplit(url).hostname, _PAGE_CACHE_EXPIRE)
+        try:
+            if time.time() - os.path.getmtime(path) < expire.total_seconds():
+                with open(path, "rb") as f:
+                    encoding, _, body = f.read().partition(b"\n")
+                return body, encoding.decode("ascii") or None
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("    [Cache] Página em cache ilegível para %s, baixando novamente: %s", url, e)
+
+        body, encoding = self._download(url)
+        try:
+            os.makedirs(_PAGE_CACHE_DIR, exist_ok=True)
+            # Grava em arquivo temporário e renomeia: outro worker nunca lê uma página pela metade
+            fd, tmp_path = tempfile.mkstemp(dir=_PAGE_CACHE_DIR, suffix=".pagina.tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write((encoding or "").encode("ascii") + b"\n" + body)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        except OSError as e:
+            logger.warning("    [Cache] Não foi possível gravar a página em cache para %s: %s", url, e)
+        return body, encoding
+
+    def _download(self, url: str):
+        # Lê no máximo _MAX_BYTES do corpo (já descomprimido): uma página anormalmente grande
+        # não pode dominar o tempo de download e de parsing. O resto do corpo nem chega a ser
+        # lido: a conexão é descartada ao sair do with. O lxml tolera o HTML truncado.
+        with self.session.get(url, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            # Só o charset declarado no cabeçalho: o padrão do requests para text/* (latin-1)
+            # impediria o parser de usar o <meta charset> da página
+            content_type = response.headers.get("Content-Type", "").lower()
+            encoding = response.encoding if "charset=" in content_type else None
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=_CHUNK_BYTES):
+                body += chunk
+                if len(body) >= _MAX_BYTES:
+                    break
+        return bytes(body[:_MAX_BYTES]), encoding
 
     def _get_soup(self, url: str):
-        response = requests.get(url, headers=self.headers, timeout=10)
-        response.raise_for_status()
-        return BeautifulSoup(response.text, "html.parser")
+        return _build_soup(*self._get_body(url))
 
-    def _from_investidor10(self, ticker: str):
+    def _get_tree(self, url: str):
+        return _build_tree(*self._get_body(url))
+
+    def _get_tree_cached(self, url: str):
+        # O cache guarda um Future por URL: chamadas simultâneas para a mesma página (ex: get_lpa_payout
+        # e get_financial_history rodando em paralelo) esperam pelo mesmo download em vez de repeti-lo.
+        with self._tree_cache_lock:
+            future = self._tree_cache.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._tree_cache[url] = future
+        if owner:
+            try:
+                future.set_result(self._get_tree(url))
+            except Exception as e:
+                future.set_exception(e)
+                with self._tree_cache_lock:
+                    self._tree_cache.pop(url, None) # Falhas não ficam em cache
+        return future.result()
+
+    def _parse_investidor10(self, soup) -> dict:
+        lpa = payout = None
+        for box in soup.find_all("div", class_="indicators-box"):
+            # Materializa o texto da caixa uma única vez
+            text = box.get_text(" ", strip=True)
+            label = text.lower()
+            if lpa is None and "lpa" in label:
+                lpa = _to_float(text.split()[-1])
+            elif payout is None and "payout" in label:
+                payout = _to_float(text.split()[-1])
+            if lpa is not None and payout is not None:
+                break
+        return {"lpa": lpa, "payout": payout}
+
+    def _parse_statusinvest(self, tree) -> dict:
+        def _extract(xpath):
+            nodes = xpath(tree)
+            return _to_float(nodes[0].text_content()) if nodes else None
+        return {
+            "lpa": _extract(_XP_SI_LPA),
+            "payout": _extract(_XP_SI_PAYOUT)
+        }
+
+    def _parse_fundamentus(self, tree) -> dict:
+        resultado = {"lpa": None, "payout": None}
+        # Uma única passada pelas linhas: cada linha traz pares rótulo/valor lado a lado,
+        # então o valor é a célula seguinte ao rótulo. Para assim que os dois campos aparecem.
+        for row in tree.iter("tr"):
+            cells = row.findall("td")
+            for label_td, value_td in zip(cells, cells[1:]):
+                campo = _FUNDAMENTUS_CAMPOS.get(label_td.text_content().strip().lower())
+                if campo and resultado[campo] is None:
+                    resultado[campo] = _to_float(value_td.text_content())
+            if all(v is not None for v in resultado.values()):
+                break
+        return resultado
+
+    def _extrair(self, fonte: str, ticker: str, url: str, carregar, parse) -> dict:
+        # Falhas transitórias já foram repetidas pelo Retry do adapter; aqui só registra e segue
+        # para a próxima fonte. Um 404 vira _TickerNaoEncontrado para o chamador decidir se para.
         try:
-            soup = self._get_soup(f"https://investidor10.com.br/acoes/{ticker.lower()}/")
-            boxes = soup.find_all("div", class_="indicators-box")
-            lpa = payout = None
-            for box in boxes:
-                text = box.get_text().lower()
-                if "lpa" in text:
-                    val = box.text.strip().split()[-1].replace(",", ".")
-                    lpa = float(val)
-                elif "payout" in text:
-                    val = box.text.strip().split()[-1].replace("%", "").replace(",", ".")
-                    payout = float(val)
-            return {"lpa": lpa, "payout": payout}
-        except Exception:
-            return {"lpa": None, "payout": None}
+            return parse(carregar(url))
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                logger.warning("    [%s] Ticker %s não encontrado (404)", fonte, ticker)
+                raise _TickerNaoEncontrado(fonte) from e
+            logger.warning("    [%s] Erro HTTP ao buscar %s: %s", fonte, ticker, e)
+        except requests.exceptions.RequestException as e:
+            logger.warning("    [%s] Falha de rede ao buscar %s: %s", fonte, ticker, e)
+        except etree.ParserError as e:
+            logger.warning("    [%s] Página inválida para %s: %s", fonte, ticker, e)
+        return {"lpa": None, "payout": None}
+
+    def _from_investidor10(self, ticker: str):
+        return self._extrair("Investidor10", ticker, _URL_INVESTIDOR10.format(ticker=ticker.lower()),
+                             self._get_soup, self._parse_investidor10)
 
     def _from_statusinvest(self, ticker: str):
-        try:
-            soup = self._get_soup(f"https://statusinvest.com.br/acoes/{ticker.lower()}")
-            def _extract(label):
-                tag = soup.find("h3", string=re.compile(label, re.IGNORECASE))
-                if tag:
-                    strong = tag.find_next("strong")
-                    if strong:
-                        value = strong.text.strip().replace(".", "").replace(",", ".").replace("%", "")
-                        return float(value)
-                return None
-            return {
-                "lpa": _extract("lpa"),
-                "payout": _extract("payout")
-            }
-        except Exception:
-            return {"lpa": None, "payout": None}
+        return self._extrair("Status Invest", ticker, _URL_STATUSINVEST.format(ticker=ticker.lower()),
+                             self._get_tree_cached, self._parse_statusinvest)
 
     def _from_fundamentus(self, ticker: str):
-        try:
-            soup = self._get_soup(f"https://www.fundamentus.com.br/detalhes.php?papel={ticker.upper()}")
-            lpa = payout = None
-            for td in soup.find_all("td"):
-                text = td.get_text(strip=True).lower()
-                if text == "lpa":
-                    try:
-                        lpa = float(td.find_next("td").text.strip().replace(",", "."))
-                    except:
-                        pass
-                elif text == "div. líquida / patrimonio":
-                    try:
-                        payout = float(td.find_next("td").text.strip().replace("%", "").replace(",", "."))
-                    except:
-                        pass
-            return {"lpa": lpa, "payout": payout}
-        except Exception:
-            return {"lpa": None, "payout": None}
+        return self._extrair("Fundamentus", ticker, _URL_FUNDAMENTUS.format(ticker=ticker.upper()),
+                             self._get_tree, self._parse_fundamentus)
+
+    @staticmethod
+    def _merge_lpa_payout(resultado: dict, res: dict) -> bool:
+        # Preenche apenas os campos ainda vazios; retorna True quando os dois estão preenchidos
+        if resultado["lpa"] is None and res["lpa"] is not None:
+            resultado["lpa"] = res["lpa"]
+        if resultado["payout"] is None and res["payout"] is not None:
+            resultado["payout"] = res["payout"]
+        return all(v is not None for v in resultado.values())
 
+    @_ttl_cache(3600)
     def get_lpa_payout(self, ticker: str) -> dict:
         resultado = {"lpa": None, "payout": None}
-        for extractor in [self._from_investidor10, self._from_statusinvest, self._from_fundamentus]:
-            try:
-                res = extractor(ticker)
-                if resultado["lpa"] is None and res["lpa"] is not None:
-                    resultado["lpa"] = res["lpa"]
-                if resultado["payout"] is None and res["payout"] is not None:
-                    resultado["payout"] = res["payout"]
-                if all(v is not None for v in resultado.values()):
+        primary, *fallbacks = [self._from_investidor10, self._from_statusinvest, self._from_fundamentus]
+        executor = ThreadPoolExecutor(max_workers=1 + len(fallbacks))
+        try:
+            # A fonte principal sai na frente: se responder com os dois campos dentro do prazo,
+            # as demais nem chegam a ser buscadas. Se não, as outras entram em paralelo.
+            futures = [executor.submit(primary, ticker)]
+            done, _ = wait(futures, timeout=_FALLBACK_DELAY_SECONDS)
+            if done:
+                try:
+                    if self._merge_lpa_payout(resultado, futures[0].result()):
+                        return resultado
+                except _TickerNaoEncontrado:
+                    return resultado
+                except Exception:
+                    pass  # Registrado no laço abaixo, que consulta o mesmo Future
+
+            futures += [executor.submit(extractor, ticker) for extractor in fallbacks]
+            for future in as_completed(futures):
+                try:
+                    res = future.result()
+                except _TickerNaoEncontrado as e:
+                    if e.fonte == _FONTE_PRINCIPAL:
+                        break
+                    continue
+                except Exception:
+                    logger.exception("    [LPA/Payout] Erro inesperado ao buscar %s", ticker)
+                    continue
+                if self._merge_lpa_payout(resultado, res):
                     break
-            except Exception:
-                continue
+        finally:
+            # Não espera pelas buscas que ainda estão rodando quando os dois campos já foram obtidos
+            executor.shutdown(wait=False, cancel_futures=True)
         return resultado
 
+    # --- Caminho assíncrono para lotes de tickers ---
+    # Mesmas fontes e mesmo parsing do caminho síncrono, mas com um cliente httpx em HTTP/2: as
+    # buscas de muitos tickers x sites se sobrepõem em uma única thread e as requisições a um mesmo
+    # site são multiplexadas na mesma conexão, em vez de um handshake TCP+TLS por requisição.
+    # O httpx é importado só aqui: a API (check_stock) usa apenas o caminho síncrono e não paga
+    # o custo de importá-lo na inicialização.
+
+    def _http2_client(self):
+        import httpx
+        return httpx.AsyncClient(
+            http2=True,
+            headers=self.headers,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            timeout=10.0,
+            follow_redirects=True,
+        )
+
+    async def _aget_body(self, session, url: str):
+        # Como no caminho síncrono: (bytes crus limitados a _MAX_BYTES, charset do Content-Type).
+        # O texto não é decodificado em Python; sem charset no cabeçalho, vale o <meta> da página.
+        async with session.stream("GET", url) as response:
+            response.raise_for_status()
+            encoding = response.charset_encoding
+            body = bytearray()
+            async for chunk in response.aiter_bytes(_CHUNK_BYTES):
+                body += chunk
+                if len(body) >= _MAX_BYTES:
+                    break
+        return bytes(body[:_MAX_BYTES]), encoding
+
+    # O parsing é CPU: roda fora do event loop para não travar as outras requisições
+    async def _aget_soup(self, session, url: str):
+        body, encoding = await self._aget_body(session, url)
+        return await asyncio.get_running_loop().run_in_executor(None, _build_soup, body, encoding)
+
+    async def _aget_tree(self, session, url: str):
+        body, encoding = await self._aget_body(session, url)
+        return await asyncio.get_running_loop().run_in_executor(None, _build_tree, body, encoding)
+
+    async def _aextrair(self, fonte: str, ticker: str, session, url: str, carregar, parse) -> dict:
+        import httpx
+        try:
+            return parse(await carregar(session, url))
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                logger.warning("    [%s] Ticker %s não encontrado (404)", fonte, ticker)
+                raise _TickerNaoEncontrado(fonte) from e
+            logger.warning("    [%s] Erro HTTP ao buscar %s: %s", fonte, ticker, e)
+        except httpx.RequestError as e:
+            logger.warning("    [%s] Falha de rede ao buscar %s: %s", fonte, ticker, e)
+        except etree.ParserError as e:
+            logger.warning("    [%s] Página inválida para %s: %s", fonte, ticker, e)
+        return {"lpa": None, "payout": None}
+
+    async def _afrom_investidor10(self, session, ticker: str):
+        return await self._aextrair("Investidor10", ticker, session, _URL_INVESTIDOR10.format(ticker=ticker.lower()),
+                                    self._aget_soup, self._parse_investidor10)
+
+    async def _afrom_statusinvest(self, session, ticker: str):
+        return await self._aextrair("Status Invest", ticker, session, _URL_STATUSINVEST.format(ticker=ticker.lower()),
+                                    self._aget_tree, self._parse_statusinvest)
+
+    async def _afrom_fundamentus(self, session, ticker: str):
+        return await self._aextrair("Fundamentus", ticker, session, _URL_FUNDAMENTUS.format(ticker=ticker.upper()),
+                                    self._aget_tree, self._parse_fundamentus)
+
+    async def aget_lpa_payout(self, ticker: str, session=None) -> dict:
+        if session is None:
+            async with self._http2_client() as session:
+                return await self.aget_lpa_payout(ticker, session)
+
+        resultado = {"lpa": None, "payout": None}
+        tasks = [
+            asyncio.ensure_future(extractor(session, ticker))
+            for extractor in (self._afrom_investidor10, self._afrom_statusinvest, self._afrom_fundamentus)
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                try:
+                    res = await next_result
+                except _TickerNaoEncontrado as e:
+                    if e.fonte == _FONTE_PRINCIPAL:
+                        break
+                    continue
+                except Exception:
+                    logger.exception("    [LPA/Payout] Erro inesperado ao buscar %s", ticker)
+                    continue
+                if self._merge_lpa_payout(resultado, res):
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+        return resultado
+
+    async def aget_many(self, tickers: list) -> dict:
+        """
+        Busca LPA/Payout de vários tickers de uma vez, compartilhando uma única sessão HTTP.
+        Retorna {ticker: {"lpa": ..., "payout": ...}}. Uso: asyncio.run(scraper.aget_many([...])).
+        """
+        semaphore = asyncio.Semaphore(16)  # no máximo 16 tickers em andamento, por educação com os sites
+
+        async with self._http2_client() as session:
+            async def _buscar(ticker):
+                async with semaphore:
+                    return await self.aget_lpa_payout(ticker, session)
+            resultados = await asyncio.gather(*(_buscar(t) for t in tickers))
+        return dict(zip(tickers, resultados))
+
+    @_ttl_cache(86400)
     def get_financial_history(self, ticker: str) -> dict:
         try:
-            soup = self._get_soup(f"https://statusinvest.com.br/acoes/{ticker.lower()}")
+            tree = self._get_tree_cached(_URL_STATUSINVEST.format(ticker=ticker.lower()))
             lucros_anuais = []
             lucro_ultimo_trimestre = None
 
-            annual_results_section = soup.find('h2', string=re.compile(r'Resultados Históricos', re.IGNORECASE))
-            if annual_results_section:
-                table = annual_results_section.find_next('table')
-                if table:
-                    for row in table.find_all('tr'):
-                        header = row.find('th')
-                        if header and re.search(r'(lucro|resultado) líquido', header.text, re.IGNORECASE):
-                            values = [td.text.strip().replace('.', '').replace(',', '.') for td in row.find_all('td')]
-                            parsed_values = []
-                            for val in reversed(values):
-                                try:
-                                    parsed_values.append(float(val))
-                                    if len(parsed_values) == 3:
-                                        break
-                                except ValueError:
-                                    continue
-                            lucros_anuais = list(reversed(parsed_values))
+            # Últimas células da linha do lucro líquido na tabela de resultados históricos
+            tds = _XP_SI_LUCROS_ANUAIS(tree)
+            if tds:
+                parsed_values = []
+                for td in reversed(tds):
+                    value = _to_float(td.text_content())
+                    if value is not None:
+                        parsed_values.append(value)
+                        if len(parsed_values) == 3:
                             break
+                lucros_anuais = list(reversed(parsed_values))
 
-            quarterly_results_section = soup.find('h3', string=re.compile(r'Resultados Trimestrais', re.IGNORECASE))
-            if quarterly_results_section:
-                table = quarterly_results_section.find_next('table')
-                if table:
-                    for row in table.find_all('tr'):
-                        header = row.find('th')
-                        if header and re.search(r'(lucro|resultado) líquido', header.text, re.IGNORECASE):
-                            last_quarter_value_tag = row.find('td') 
-                            if last_quarter_value_tag:
-                                value_str = last_quarter_value_tag.text.strip().replace('.', '').replace(',', '.')
-                                try:
-                                    lucro_ultimo_trimestre = float(value_str)
-                                except ValueError:
-                                    lucro_ultimo_trimestre = None
-                            break
+            tds = _XP_SI_LUCRO_TRIMESTRE(tree)
+            if tds:
+                lucro_ultimo_trimestre = _to_float(tds[0].text_content())
 
             return {
                 "lucros_anuais": lucros_anuais,
                 "lucro_ultimo_trimestre": lucro_ultimo_trimestre
             }
-        except Exception as e:
-            print(f"Erro ao extrair histórico financeiro para {ticker}: {e}")
-            return {"lucros_anuais": [], "lucro_ultimo_trimestre": None}
\ No newline at end of file
+        except (requests.exceptions.RequestException, etree.ParserError) as e:
+            logger.warning("    [Histórico Financeiro] Erro ao extrair histórico financeiro para %s: %s", ticker, e)
+        except Exception:
+            # Uma falha inesperada no scraping não pode derrubar o check_stock inteiro
+            logger.exception("    [Histórico Financeiro] Erro inesperado ao extrair histórico financeiro para %s", ticker)
+        return {"lucros_anuais": [], "lucro_ultimo_trimestre": None}
\ No newline at end of file
@@ -0,0 +1,37 @@
+import numba
+import numpy as np
+
+
+@numba.njit(parallel=True, nogil=True, cache=True)
+def annualized_vol_matrix(close):
+    """
+    Volatilidade anualizada (desvio padrão amostral dos log-retornos diários * sqrt(252))
+    de cada coluna de uma matriz de preços de fechamento (T dias x N tickers), em float64.
+
+    Dias sem cotação (NaN) são ignorados por coluna, como no np.nanstd. Colunas com menos
+    de dois retornos válidos resultam em NaN. Compilado com Numba: as colunas são processadas
+    em paralelo e sem o GIL, o que importa quando o benchmark tem centenas de tickers.
+    """
+    T, N = close.shape
+    out = np.empty(N)
+    for j in numba.prange(N):
+        # Primeira passada: média dos log-retornos válidos
+        s = 0.0
+        cnt = 0
+        for t in range(1, T):
+            r = np.log(close[t, j] / close[t - 1, j])
+            if np.isfinite(r):
+                s += r
+                cnt += 1
+        if cnt < 2:
+            out[j] = np.nan
+            continue
+        mean = s / cnt
+        # Segunda passada: soma dos desvios quadráticos (numericamente mais estável que s2/n - mean^2)
+        ss = 0.0
+        for t in range(1, T):
+            r = np.log(close[t, j] / close[t - 1, j])
+            if np.isfinite(r):
+                ss += (r - mean) * (r - mean)
+        out[j] = np.sqrt(ss / (cnt - 1)) * np.sqrt(252.0)
+    return out
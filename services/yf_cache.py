@@ -0,0 +1,62 @@
+import os
+import threading
+import requests_cache
+import yfinance as yf
+import pandas as pd
+from cachetools import TTLCache
+
+# Sessão HTTP com cache em SQLite usada pelo yfinance: requisições idênticas ao Yahoo dentro
+# do TTL são respondidas do disco, inclusive entre processos/workers e reinícios.
+YF_HTTP_CACHE_TTL_SECONDS = 3600
+
+_yf_session = None
+_yf_session_pid = None
+_yf_session_lock = threading.Lock()
+
+
+def get_yf_session() -> requests_cache.CachedSession:
+    """
+    Retorna a sessão HTTP do yfinance deste processo, criando-a no primeiro uso.
+
+    Uma sessão por processo: com o preload_app do Gunicorn, o master baixa o benchmark antes do
+    fork, e as conexões keep-alive e o handle do SQLite dele não podem ser herdados e usados ao
+    mesmo tempo pelos workers.
+    """
+    global _yf_session, _yf_session_pid
+    with _yf_session_lock:
+        if _yf_session is None or _yf_session_pid != os.getpid():
+            _yf_session = requests_cache.CachedSession(
+                'yf_http_cache', backend='sqlite', expire_after=YF_HTTP_CACHE_TTL_SECONDS
+            )
+            _yf_session_pid = os.getpid()
+        return _yf_session
+
+
+# Memo em memória dos downloads. Mesmo prazo do cache em parquet (hist_cache): quando o parquet
+# expira, o download é refeito de fato em vez de voltar o mesmo DataFrame da memória.
+DOWNLOAD_MEMO_TTL_SECONDS = 4 * 3600
+_download_memo = TTLCache(maxsize=256, ttl=DOWNLOAD_MEMO_TTL_SECONDS)
+_download_memo_lock = threading.Lock()
+
+
+def cached_download(ticker: str, start_iso: str, end_iso: str, actions: bool = False) -> pd.DataFrame:
+    """
+    yf.download com cache em memória por ticker + intervalo de datas (YYYY-MM-DD), válido por
+    DOWNLOAD_MEMO_TTL_SECONDS.
+
+    Chamadas repetidas para o mesmo ticker e intervalo dentro do prazo reutilizam o mesmo
+    DataFrame em vez de ir ao Yahoo de novo. Downloads vazios (falha de rede, ticker inválido)
+    não ficam em cache.
+
+    O DataFrame retornado é compartilhado entre as chamadas: não deve ser modificado.
+    """
+    key = (ticker, start_iso, end_iso, actions)
+    with _download_memo_lock:
+        data = _download_memo.get(key)
+    if data is None:
+        data = yf.download(ticker, start=start_iso, end=end_iso, actions=actions, progress=False, session=get_yf_session())
+        if data.empty:
+            return pd.DataFrame()
+        with _download_memo_lock:
+            _download_memo[key] = data
+    return data